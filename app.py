@@ -5,11 +5,15 @@ A single-file full-stack web application using Flask backend with embedded HTML/
 
 Setup Instructions:
 1. Install required dependencies:
-   pip install flask numpy opencv-python pillow scikit-image
+   pip install flask numpy opencv-python numba orjson
 
-2. Run the application:
+2. Run the application (development):
    python app.py
 
+   Or in production (preloaded so the detector and warmed JIT caches are
+   shared copy-on-write across workers):
+   gunicorn -w $(nproc) -k gthread --threads 4 --preload app:app
+
 3. Open your browser and navigate to:
    http://localhost:5000
 
@@ -19,15 +23,22 @@ you would replace the mock detection with a real U-Net model.
 
 import os
 import base64
-import io
-import json
-import random
+import hashlib
 import numpy as np
 import cv2
-from PIL import Image, ImageDraw
-from flask import Flask, render_template_string, request, jsonify
-from skimage import measure, morphology
+import orjson
+from flask import Flask, Response, request, jsonify
 import logging
+import threading
+
+from detector_kernels import (NORM_LUT, blend_highlight, contour_centroid,
+                              rasterize_ellipses, shape_consts)
+
+# Pin OpenCV to a single internal thread: under a multi-worker server its
+# default thread pool contends across concurrent requests and makes contour
+# ops slower, not faster. Horizontal scaling comes from worker count.
+cv2.setNumThreads(1)
+cv2.ocl.setUseOpenCL(False)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +48,25 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Shared generator for the mock detector; numpy's batched draws avoid the
+# per-call overhead of Python's random module.
+_RNG = np.random.default_rng()
+
+# Per-thread scratch buffers for preprocessing, so gthread workers reuse
+# the same 256x256 resize/normalize storage instead of allocating fresh
+# buffers every request.
+_scratch = threading.local()
+
+
+def _preprocess_buffers():
+    bufs = getattr(_scratch, 'bufs', None)
+    if bufs is None:
+        bufs = (np.empty((256, 256), dtype=np.uint8),
+                np.empty((256, 256), dtype=np.float32))
+        _scratch.bufs = bufs
+    return bufs
+
+
 class KidneyStoneDetector:
     """
     Mock kidney stone detection system that simulates U-Net model behavior.
@@ -45,59 +75,77 @@ class KidneyStoneDetector:
     
     def __init__(self):
         self.model_loaded = True
+        # Flips to True once a real U-Net is wired in; gates the model-input
+        # preprocessing that the mock pipeline doesn't need.
+        self.model_loaded_real = False
         logger.info("Mock kidney stone detection model initialized")
     
-    def preprocess_image(self, image):
+    def preprocess_image(self, image, normalize=True):
         """
         Preprocess image for model input.
         Typically involves resizing, normalization, and format conversion.
+        Pass normalize=False to skip the float conversion when the caller
+        only needs the uint8 image (e.g., the mock detection path).
+
+        The returned model-input array is this thread's scratch buffer and
+        is only valid until the next preprocess_image call on the thread.
         """
-        # Convert PIL to numpy array
-        img_array = np.array(image)
-        
+        # Accept either a numpy array or a PIL image without copying
+        img_array = np.asarray(image)
+
         # Convert to grayscale if needed
         if len(img_array.shape) == 3:
             img_gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
         else:
             img_gray = img_array
-        
-        # Resize to model input size (typically 256x256 for U-Net)
-        img_resized = cv2.resize(img_gray, (256, 256))
-        
-        # Normalize to [0, 1]
-        img_normalized = img_resized.astype(np.float32) / 255.0
-        
-        return img_normalized, img_array
+
+        # Resize to model input size (typically 256x256 for U-Net),
+        # writing into the per-thread scratch buffer
+        resize_buf, norm_buf = _preprocess_buffers()
+        cv2.resize(img_gray, (256, 256), dst=resize_buf, interpolation=cv2.INTER_AREA)
+
+        if not normalize:
+            return resize_buf, img_array
+
+        # Normalize to [0, 1] via the precomputed LUT (single indexed pass,
+        # no per-pixel divide, no fresh allocation)
+        np.take(NORM_LUT, resize_buf, out=norm_buf)
+
+        return norm_buf, img_array
     
     def generate_mock_segmentation(self, image_shape):
         """
-        Generate a realistic mock segmentation mask.
+        Generate a realistic mock segmentation mask with at least one stone.
+        The stone-present/absent coin flip happens in predict() so the
+        no-stone branch never reaches this method.
         In production, this would be: prediction = model.predict(preprocessed_image)
         """
-        mask = np.zeros(image_shape[:2], dtype=np.uint8)
-        
-        # Simulate kidney stone detection with 70% probability
-        if random.random() < 0.7:
-            # Generate random stone-like shapes
-            num_stones = random.randint(1, 3)
-            for _ in range(num_stones):
-                center_x = random.randint(50, image_shape[1] - 50)
-                center_y = random.randint(50, image_shape[0] - 50)
-                radius = random.randint(8, 25)
-                
-                # Create elliptical stone shape
-                cv2.ellipse(mask, (center_x, center_y), (radius, int(radius * 0.8)), 
-                           random.randint(0, 180), 0, 360, 255, -1)
-        
+        _, _, template = shape_consts(*image_shape[:2])
+        mask = template.copy()
+
+        # Draw all stone parameters (center x/y, radius, angle) in one
+        # batched call, then rasterize them in one compiled pass
+        num_stones = int(_RNG.integers(1, 4))
+        params = _RNG.integers(
+            [50, 50, 8, 0],
+            [image_shape[1] - 49, image_shape[0] - 49, 26, 181],
+            size=(num_stones, 4)).astype(np.float64)
+        centers_x = params[:, 0]
+        centers_y = params[:, 1]
+        radii_x = params[:, 2]
+        radii_y = radii_x * 0.8
+        angles = params[:, 3]
+
+        rasterize_ellipses(mask, centers_x, centers_y, radii_x, radii_y, angles)
+
         return mask
     
-    def analyze_segmentation(self, mask):
+    def analyze_segmentation(self, mask, contours):
         """
-        Analyze the segmentation mask to extract stone properties.
+        Analyze the segmentation contours to extract stone properties.
+        Contours are computed once by the caller and shared with
+        create_highlighted_image.
         """
-        # Find contours
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
         if not contours:
             return {
                 'stone_detected': False,
@@ -106,23 +154,25 @@ class KidneyStoneDetector:
                 'confidence': 0.0
             }
         
-        # Analyze largest contour (primary stone)
-        largest_contour = max(contours, key=cv2.contourArea)
-        area = cv2.contourArea(largest_contour)
+        # Analyze largest contour (primary stone) — compute every area
+        # exactly once and reuse the winning value instead of re-calling
+        # cv2.contourArea on it
+        areas = np.fromiter((cv2.contourArea(c) for c in contours),
+                            dtype=np.float32, count=len(contours))
+        largest_idx = int(areas.argmax())
+        largest_contour = contours[largest_idx]
+        area = float(areas[largest_idx])
         
-        # Get stone location
-        M = cv2.moments(largest_contour)
-        if M["m00"] != 0:
-            cx = int(M["m10"] / M["m00"])
-            cy = int(M["m01"] / M["m00"])
-        else:
-            cx, cy = 0, 0
+        # Get stone location via the shoelace centroid of the contour —
+        # same area-weighted centroid cv2.moments would give, without
+        # computing the other 23 unused moment values
+        cx, cy = contour_centroid(largest_contour)
         
         # Determine anatomical location based on position
-        height = mask.shape[0]
-        if cy < height / 3:
+        upper, mid, _ = shape_consts(*mask.shape[:2])
+        if cy < upper:
             location = "Upper Pole"
-        elif cy < 2 * height / 3:
+        elif cy < mid:
             location = "Mid-Kidney"
         else:
             location = "Lower Pole"
@@ -131,11 +181,11 @@ class KidneyStoneDetector:
             'stone_detected': True,
             'size_pixels': int(area),
             'location': location,
-            'confidence': random.uniform(0.85, 0.98),
+            'confidence': _RNG.uniform(0.85, 0.98),
             'center': (cx, cy)
         }
     
-    def create_highlighted_image(self, original_image, mask, analysis_result):
+    def create_highlighted_image(self, original_image, contours, analysis_result):
         """
         Create an image with detected kidney stones highlighted.
         """
@@ -146,44 +196,61 @@ class KidneyStoneDetector:
             highlighted = cv2.cvtColor(original_image, cv2.COLOR_GRAY2RGB)
         
         if analysis_result['stone_detected']:
-            # Find contours
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            
-            # Draw contours and highlights
-            for contour in contours:
-                # Draw filled contour with transparency
-                overlay = highlighted.copy()
-                cv2.fillPoly(overlay, [contour], (255, 100, 100))  # Red highlight
-                highlighted = cv2.addWeighted(highlighted, 0.7, overlay, 0.3, 0)
-                
-                # Draw contour outline
-                cv2.drawContours(highlighted, [contour], -1, (255, 0, 0), 2)
-                
-                # Add arrow and label
-                if 'center' in analysis_result:
-                    cx, cy = analysis_result['center']
-                    cv2.arrowedLine(highlighted, (cx + 30, cy - 30), (cx, cy), (0, 255, 0), 2)
-                    cv2.putText(highlighted, "STONE", (cx + 35, cy - 35), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            # Blend the red highlight over all stones in a single fused
+            # pass: one binary mask, then an in-place jitted blend that
+            # touches each pixel exactly once.
+            stone_mask = np.zeros(highlighted.shape[:2], dtype=np.uint8)
+            cv2.fillPoly(stone_mask, contours, 1)
+            blend_highlight(highlighted, stone_mask, 255, 100, 100)  # Red highlight
+
+            # Draw all contour outlines in one call
+            cv2.drawContours(highlighted, contours, -1, (255, 0, 0), 2)
+
+            # Add arrow and label
+            if 'center' in analysis_result:
+                cx, cy = analysis_result['center']
+                cv2.arrowedLine(highlighted, (cx + 30, cy - 30), (cx, cy), (0, 255, 0), 2)
+                cv2.putText(highlighted, "STONE", (cx + 35, cy - 35),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
         
         return highlighted
     
     def predict(self, image):
         """
-        Main prediction method that processes an image and returns detection results.
+        Main prediction method that processes an RGB image array and returns
+        detection results.
         """
         try:
-            # Preprocess image
-            preprocessed, original_array = self.preprocess_image(image)
-            
+            # The mock pipeline only needs the original pixels; the
+            # grayscale/resize preprocessing is for real model inference.
+            if self.model_loaded_real:
+                preprocessed, original_array = self.preprocess_image(image)
+            else:
+                original_array = np.asarray(image)
+
+            # Decide stone presence up front (70% probability): the no-stone
+            # branch skips mask generation, contour search and highlighting
+            # entirely and returns the original image untouched.
+            if _RNG.random() >= 0.7:
+                analysis = {
+                    'stone_detected': False,
+                    'size_pixels': 0,
+                    'location': 'None',
+                    'confidence': 0.0
+                }
+                return analysis, original_array
+
             # Generate mock segmentation (replace with actual model inference)
             mask = self.generate_mock_segmentation(original_array.shape)
-            
+
+            # Find contours once and share them between analysis and drawing
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
             # Analyze segmentation results
-            analysis = self.analyze_segmentation(mask)
-            
+            analysis = self.analyze_segmentation(mask, contours)
+
             # Create highlighted image
-            highlighted_image = self.create_highlighted_image(original_array, mask, analysis)
+            highlighted_image = self.create_highlighted_image(original_array, contours, analysis)
             
             return analysis, highlighted_image
             
@@ -417,7 +484,7 @@ HTML_TEMPLATE = '''
             
             // Display processed image
             const processedImage = document.getElementById('processedImage');
-            processedImage.src = `data:image/png;base64,${result.processed_image}`;
+            processedImage.src = `data:${result.processed_image_mime};base64,${result.processed_image}`;
             
             // Update detection status
             const detectionStatus = document.getElementById('detectionStatus');
@@ -445,10 +512,18 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
+# The template has no variables, so skip Jinja entirely: encode it once at
+# import and serve the bytes with caching headers.
+_INDEX_BYTES = HTML_TEMPLATE.encode('utf-8')
+_INDEX_ETAG = hashlib.md5(_INDEX_BYTES).hexdigest()
+
+
 @app.route('/')
 def index():
     """Serve the main HTML page."""
-    return render_template_string(HTML_TEMPLATE)
+    return Response(_INDEX_BYTES, mimetype='text/html',
+                    headers={'Cache-Control': 'public, max-age=3600',
+                             'ETag': _INDEX_ETAG})
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -470,21 +545,45 @@ def predict():
         if file_ext not in allowed_extensions:
             return jsonify({'error': 'Invalid file type. Please upload JPG, JPEG, or PNG images.'}), 400
         
-        # Open and process image
-        image = Image.open(file.stream)
-        
-        # Ensure image is in RGB mode
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
+        # Decode directly with OpenCV (libjpeg-turbo, SIMD) instead of PIL,
+        # getting a numpy array back without an extra conversion copy.
+        # Keep the raw bytes: the no-stone path returns them unmodified.
+        file_bytes = file.read()
+        raw = np.frombuffer(file_bytes, dtype=np.uint8)
+        bgr = cv2.imdecode(raw, cv2.IMREAD_COLOR)
+        if bgr is None:
+            return jsonify({'error': 'Could not decode image file. Please upload a valid image.'}), 400
+        image = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+        # Cap the working resolution: contour search, overlay blending and
+        # the base64 encode all scale with pixel count, and a 1024px-max-side
+        # preview is plenty for the browser.
+        height, width = image.shape[:2]
+        scale = min(1.0, 1024 / max(height, width))
+        if scale < 1.0:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)),
+                               interpolation=cv2.INTER_AREA)
+
         # Run detection
         analysis_result, highlighted_image = detector.predict(image)
         
-        # Convert highlighted image to base64
-        pil_image = Image.fromarray(highlighted_image)
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        processed_image_b64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # Convert the processed image to base64
+        if analysis_result['stone_detected']:
+            # JPEG at quality 85 is ~5-10x smaller than PNG for the
+            # highlighted preview, and OpenCV's encoder is much faster
+            # than PIL's PNG path.
+            ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(highlighted_image, cv2.COLOR_RGB2BGR),
+                                       [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+            if not ok:
+                raise RuntimeError("Failed to encode processed image")
+            # b64encode on a memoryview avoids copying the encoded bytes first
+            processed_image_b64 = base64.b64encode(memoryview(encoded)).decode('ascii')
+            processed_image_mime = 'image/jpeg'
+        else:
+            # Nothing was drawn, so skip the re-encode and pass the original
+            # upload bytes straight through
+            processed_image_b64 = base64.b64encode(file_bytes).decode('ascii')
+            processed_image_mime = 'image/png' if file_ext == '.png' else 'image/jpeg'
         
         # Generate detailed report
         if analysis_result['stone_detected']:
@@ -511,15 +610,17 @@ def predict():
             If you have symptoms or concerns, please consult with a healthcare professional.
             """.strip()
         
-        # Return JSON response
-        return jsonify({
+        # Return JSON response; orjson serializes the multi-MB base64 string
+        # much faster than Flask's jsonify
+        return Response(orjson.dumps({
             'stone_detected': analysis_result['stone_detected'],
             'size_pixels': analysis_result['size_pixels'],
             'location': analysis_result['location'],
             'confidence': analysis_result.get('confidence', 0),
             'processed_image': processed_image_b64,
+            'processed_image_mime': processed_image_mime,
             'report': report
-        })
+        }), mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error in /predict endpoint: {str(e)}")
@@ -533,8 +634,12 @@ if __name__ == '__main__':
     print("=" * 60)
     print("AI-Powered Kidney Stone Detection System")
     print("=" * 60)
-    print("Starting Flask server...")
+    print("Starting Flask development server...")
     print("Open your browser and navigate to: http://localhost:5000")
+    print("For production use: gunicorn -w $(nproc) -k gthread --threads 4 --preload app:app")
     print("=" * 60)
-    
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+
+    # Development fallback only. The debugger/reloader serializes requests
+    # and re-imports the module on every change; serve through gunicorn
+    # with --preload in production (see module docstring).
+    app.run(debug=False, threaded=True, host='0.0.0.0', port=5000)
\ No newline at end of file
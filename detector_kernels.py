@@ -0,0 +1,103 @@
+"""
+Numeric kernels for the kidney stone detector.
+
+Everything here is plain numpy arithmetic (plus Numba JIT for the
+per-pixel loops) with no Flask or I/O dependencies, so the hot path is
+isolated from the web layer. The @njit kernels use cache=True, which
+persists the compiled machine code on disk — after the first run, new
+processes load the cached binaries instead of re-JITting, keeping cold
+starts cheap.
+"""
+
+import functools
+
+import numpy as np
+from numba import njit, prange
+
+# Precomputed lookup table mapping uint8 pixel values to [0, 1] floats.
+# Indexing with it replaces the per-pixel float divide in normalization.
+NORM_LUT = np.arange(256, dtype=np.float32) / 255.0
+
+
+@functools.lru_cache(maxsize=32)
+def shape_consts(height, width):
+    """
+    Per-shape constants for the mock detector: the Upper/Mid/Lower-Pole
+    thresholds and a zeroed mask template to copy from. Uploads tend to
+    repeat a handful of sizes, so these are cached by shape.
+    """
+    return height // 3, 2 * height // 3, np.zeros((height, width), dtype=np.uint8)
+
+
+@njit(cache=True, fastmath=True)
+def rasterize_ellipses(mask, centers_x, centers_y, radii_x, radii_y, angles):
+    """
+    Rasterize all stone ellipses into the mask in a single compiled pass.
+    Each ellipse is tested only inside its bounding box using the rotated
+    inside-ellipse equation, avoiding one cv2.ellipse call per stone.
+    """
+    height, width = mask.shape
+    for i in range(centers_x.shape[0]):
+        cx = centers_x[i]
+        cy = centers_y[i]
+        rx = radii_x[i]
+        ry = radii_y[i]
+        theta = angles[i] * np.pi / 180.0
+        cos_t = np.cos(theta)
+        sin_t = np.sin(theta)
+        r_max = max(rx, ry)
+        y0 = max(0, int(cy - r_max))
+        y1 = min(height, int(cy + r_max) + 1)
+        x0 = max(0, int(cx - r_max))
+        x1 = min(width, int(cx + r_max) + 1)
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                dx = x - cx
+                dy = y - cy
+                u = (dx * cos_t + dy * sin_t) / rx
+                v = (-dx * sin_t + dy * cos_t) / ry
+                if u * u + v * v <= 1.0:
+                    mask[y, x] = 255
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def blend_highlight(dst, mask, red, green, blue):
+    """
+    Blend the highlight color into dst (in place) wherever mask is set.
+    One read and one write per pixel, instead of separate overlay-copy and
+    addWeighted passes over the whole image.
+    """
+    height, width = mask.shape
+    for y in prange(height):
+        for x in range(width):
+            if mask[y, x]:
+                dst[y, x, 0] = np.uint8(dst[y, x, 0] * 0.7 + red * 0.3)
+                dst[y, x, 1] = np.uint8(dst[y, x, 1] * 0.7 + green * 0.3)
+                dst[y, x, 2] = np.uint8(dst[y, x, 2] * 0.7 + blue * 0.3)
+
+
+def contour_centroid(contour):
+    """
+    Area-weighted (shoelace) centroid of a contour — the same centroid
+    cv2.moments would give, without computing the other 23 unused moment
+    values. Falls back to the vertex mean for degenerate zero-area contours.
+    """
+    pts = contour.reshape(-1, 2).astype(np.float64)
+    x, y = pts[:, 0], pts[:, 1]
+    x_next, y_next = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y_next - x_next * y
+    signed_area = cross.sum() / 2.0
+    if signed_area != 0:
+        cx = int(((x + x_next) * cross).sum() / (6.0 * signed_area))
+        cy = int(((y + y_next) * cross).sum() / (6.0 * signed_area))
+    else:
+        cx, cy = int(x.mean()), int(y.mean())
+    return cx, cy
+
+
+# Warm the JITs at import so the first request doesn't pay compilation cost
+rasterize_ellipses(np.zeros((8, 8), dtype=np.uint8),
+                   np.array([4.0]), np.array([4.0]),
+                   np.array([2.0]), np.array([2.0]), np.array([0.0]))
+blend_highlight(np.zeros((8, 8, 3), dtype=np.uint8),
+                np.ones((8, 8), dtype=np.uint8), 255, 100, 100)